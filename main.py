@@ -1,35 +1,64 @@
 from __future__ import annotations
+import argparse
+import atexit
 import logging
+import os
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 from src.config import settings
-import time
-from typing import List
+from typing import List, Optional
 from langchain.schema import Document
 from src.data_loader import load_test_docs
 from src.vector_store import initialize_vectorstore
 from src.qa_chain import create_qa_chain
-from src.utils.tone import detect_tone
+from src.tracing import traced_invoke, record_trace
+
+_log_listener: Optional[QueueListener] = None
 
 
 # ─────────────────────────────────────────────────────────────────────────────
+def _start_log_listener(handler: QueueHandler, targets: List[logging.Handler]) -> None:
+    """
+        (Re)inicia a thread que grava os logs enfileirados por `handler`.
+        Também roda em cada worker após o fork, com fila nova, pois a thread do pai não existe no filho.
+    """
+    global _log_listener
+    handler.queue = queue.SimpleQueue()
+    _log_listener = QueueListener(handler.queue, *targets, respect_handler_level=True)
+    _log_listener.start()
+
+
+def _stop_log_listener() -> None:
+    if _log_listener is not None:
+        _log_listener.stop()
+
+
 def _setup_logging() -> None:
     """
         Configuração global de logging (console + arquivo) e silenciamento de libs barulhentas.
-        Cria logs em ./logs/rag.log.
+        Cria logs em ./logs/rag.log. Os handlers rodam numa thread própria (QueueListener),
+        então o caminho da pergunta só enfileira o registro.
     """
-    fmt = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
-
-    logging.basicConfig(
-        level=logging.INFO,
-        format=fmt,
-        handlers=[
-            logging.StreamHandler(),
-            logging.FileHandler(
-                Path(settings.log_dir) / "rag.log",
-                encoding="utf-8",
-            ),
-        ],
-    )
+    formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    handlers = [
+        logging.StreamHandler(),
+        logging.FileHandler(
+            Path(settings.log_dir) / "rag.log",
+            encoding="utf-8",
+        ),
+    ]
+    for h in handlers:
+        h.setFormatter(formatter)
+
+    queue_handler = QueueHandler(queue.SimpleQueue())
+    _start_log_listener(queue_handler, handlers)
+    atexit.register(_stop_log_listener)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=lambda: _start_log_listener(queue_handler, handlers))
+
+    logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
     # ── Silencia bibliotecas de terceiros ────────────────────────
     for noisy in ("httpx", "langchain", "langchain_core", "openai"):
         logging.getLogger(noisy).setLevel(logging.WARNING)
@@ -50,10 +79,22 @@ def _docs_as_langchain(raw_docs: List[dict]) -> List[Document]:
     ]
 
 
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Pipeline RAG da Reforma Tributária.")
+    parser.add_argument("--serve", action="store_true", help="Sobe o servidor HTTP (pre-fork) em vez do loop interativo.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=None, help="Nº de workers (padrão: nº de CPUs).")
+    return parser.parse_args()
+
+
 def main() -> None:
     """
-        Função principal: carrega dados, inicializa o pipeline e executa o loop de perguntas e respostas.
+        Função principal: carrega dados, inicializa o pipeline e executa o loop de perguntas e respostas
+        (ou, com --serve, atende via HTTP em vários processos).
     """
+    boot_time = time.monotonic()
+    args = _parse_args()
     _setup_logging()
     log = logging.getLogger(__name__)
 
@@ -72,7 +113,13 @@ def main() -> None:
         score_threshold=0.35,
     )
 
-    # 4) Loop interativo
+    # 4) Servidor HTTP: índice e chain ficam prontos aqui e os workers herdam via fork
+    if args.serve:
+        from src.server import serve
+        serve(rag, host=args.host, port=args.port, workers=args.workers, boot_time=boot_time)
+        return
+
+    # 5) Loop interativo
     print("Pipeline RAG pronto! (digite 'sair' ou Ctrl+C para finalizar)")
     try:
         while True:
@@ -82,14 +129,12 @@ def main() -> None:
             if pergunta.lower() in ("sair", "exit", "quit"):
                 break
 
-            tone = detect_tone(pergunta)
-            t0 = time.perf_counter()
-            result = rag.invoke({"query": pergunta, "tone": tone})
-            dt = time.perf_counter() - t0
+            result, trace = traced_invoke(rag, pergunta)
+            record_trace(trace)
 
             resposta = result["result"]
             print("\nResposta:", resposta)
-            print(f"( {dt:.2f}s – tom detectado: {tone})")
+            print(f"( {trace['timings']['total']:.2f}s – tom detectado: {trace['tone']})")
             print("-" * 60)
 
     except KeyboardInterrupt:
@@ -34,6 +34,13 @@ TOP_P: Final[float] = float(os.getenv("TOP_P", "1.0"))
 PROJECT_ROOT: Final[Path] = Path(__file__).resolve().parent.parent
 LOG_DIR: Final[Path] = Path(os.getenv("LOG_DIR", PROJECT_ROOT / "logs"))
 
+# Casos de tom classificados só pela LLM + tabela minerada por tools/minerar_tone.py
+TONE_CASES_LOG: Final[Path] = LOG_DIR / "tone_llm_cases.txt"
+TONE_KEYWORDS_FILE: Final[Path] = Path(os.getenv("TONE_KEYWORDS_FILE", LOG_DIR / "tone_keywords.json"))
+
+# Traces estruturados (JSONL) de cada pergunta, usados por tools/replay_traces.py
+TRACE_LOG: Final[Path] = Path(os.getenv("TRACE_LOG", LOG_DIR / "traces.jsonl"))
+
 # Cria pastas se não existirem
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -42,6 +49,13 @@ LOG_DIR.mkdir(parents=True, exist_ok=True)
 # ─────────────────────────────────────────────────────────────────────────────
 # → desligar telemetria de Chroma (boa prática para produção)
 CHROMA_TELEMETRY: Final[bool] = os.getenv("CHROMA_TELEMETRY", "false").lower() == "true"
+# → tamanho máximo do log de casos de tom antes de rotacionar
+TONE_LOG_MAX_BYTES: Final[int] = int(os.getenv("TONE_LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+# → tamanho máximo do arquivo de traces antes de rotacionar
+TRACE_LOG_MAX_BYTES: Final[int] = int(os.getenv("TRACE_LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+# → quantos segmentos rotacionados manter de cada log (os mais antigos são apagados; 0 = todos)
+TONE_LOG_BACKUP_COUNT: Final[int] = int(os.getenv("TONE_LOG_BACKUP_COUNT", "10"))
+TRACE_LOG_BACKUP_COUNT: Final[int] = int(os.getenv("TRACE_LOG_BACKUP_COUNT", "10"))
 
 
 class Settings:
@@ -58,6 +72,13 @@ class Settings:
     top_p = TOP_P
     log_dir = LOG_DIR
     chroma_telemetry = CHROMA_TELEMETRY
+    tone_cases_log = TONE_CASES_LOG
+    tone_keywords_file = TONE_KEYWORDS_FILE
+    tone_log_max_bytes = TONE_LOG_MAX_BYTES
+    tone_log_backup_count = TONE_LOG_BACKUP_COUNT
+    trace_log = TRACE_LOG
+    trace_log_max_bytes = TRACE_LOG_MAX_BYTES
+    trace_log_backup_count = TRACE_LOG_BACKUP_COUNT
 
 
 settings = Settings()
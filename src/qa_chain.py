@@ -1,5 +1,6 @@
 from __future__ import annotations
 from langchain.prompts import PromptTemplate
+from langchain_core.language_models import BaseLanguageModel
 from langchain.schema.vectorstore import VectorStore
 from langchain_openai import ChatOpenAI
 from src.config import settings
@@ -27,6 +28,64 @@ PROMPT = PromptTemplate(
     template=TEMPLATE,
 )
 
+# ──────────────────── Prompts de contexto longo ──────────────────────────────
+# map_reduce: cada pacote de trechos passa pelo PROMPT acima (map, em paralelo)
+# e as respostas parciais são combinadas aqui (reduce).
+REDUCE_TEMPLATE = """\
+Você é um assistente tributário. Abaixo estão respostas parciais para a mesma pergunta,
+cada uma baseada em um trecho diferente do contexto. Combine-as em uma única resposta,
+sem repetir informações e **sem acrescentar** nada que não esteja nelas.
+Se nenhuma resposta parcial responder à pergunta, responda exatamente: **"Desculpe, não sei essa informação."**
+
+Adote o tom {tone}.
+
+=== RESPOSTAS PARCIAIS
+{summaries}
+=== FIM DAS RESPOSTAS PARCIAIS
+
+Pergunta do usuário:
+{question}
+
+Sua resposta (em português):"""
+REDUCE_PROMPT = PromptTemplate(
+    input_variables=["summaries", "question", "tone"],
+    template=REDUCE_TEMPLATE,
+)
+
+# refine: a primeira resposta usa o PROMPT; cada pacote seguinte refina a anterior.
+REFINE_TEMPLATE = """\
+Você é um assistente tributário. Já existe uma resposta para a pergunta do usuário,
+baseada em parte do contexto. Use o novo trecho abaixo para completá-la ou corrigi-la,
+utilizando **somente** as informações fornecidas. Se o trecho não ajudar, repita a resposta existente.
+
+Adote o tom {tone}.
+
+Resposta existente:
+{existing_answer}
+
+=== NOVO TRECHO
+{context}
+=== FIM DO TRECHO
+
+Pergunta do usuário:
+{question}
+
+Sua resposta refinada (em português):"""
+REFINE_PROMPT = PromptTemplate(
+    input_variables=["existing_answer", "context", "question", "tone"],
+    template=REFINE_TEMPLATE,
+)
+
+CHAIN_TYPE_KWARGS = {
+    "stuff": {"prompt": PROMPT},
+    "map_reduce": {"question_prompt": PROMPT, "combine_prompt": REDUCE_PROMPT},
+    "refine": {
+        "question_prompt": PROMPT,
+        "refine_prompt": REFINE_PROMPT,
+        "document_variable_name": "context",
+    },
+}
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 def create_qa_chain(
@@ -38,6 +97,9 @@ def create_qa_chain(
     chain_type: str = "stuff",
     mmr: bool = False,
     stream: bool = False,
+    llm: BaseLanguageModel | None = None,
+    max_concurrency: int = 4,
+    map_token_max: int = 3000,
 ) -> SafeRetrievalQA:
     """
     Retorna uma RetrievalQA já configurada.
@@ -48,8 +110,14 @@ def create_qa_chain(
         k          : Nº de trechos a recuperar.
         score_threshold: Similaridade mínima (0‑1) para aceitar chunk.
         chain_type : 'stuff'|'map_reduce'|'refine' (ver docs LangChain).
+                     Em 'map_reduce' as chamadas de map rodam em paralelo; use
+                     para k alto em perguntas amplas.
         mmr        : Se True, usa busca Max‑Marginal‑Relevance.
         stream     : Se True, ativa streaming de tokens no ChatOpenAI.
+        llm        : LLM já instanciado (ex.: stub no replay); ignora model_name/stream.
+        max_concurrency: Máx. de chamadas de map simultâneas (map_reduce).
+        map_token_max: Orçamento de tokens por pacote de trechos (map_reduce/refine);
+                     trechos que cabem juntos viram uma única chamada.
 
     Raises:
         ValueError se não houver docs relevantes (condição verificada
@@ -63,22 +131,27 @@ def create_qa_chain(
     )
 
     # 2) LLM
-    llm = ChatOpenAI(
-        model=model_name or settings.default_model,
-        openai_api_key=settings.api_key,
-        temperature=settings.temperature,
-        max_tokens=settings.max_tokens,
-        top_p=settings.top_p,
-        streaming=stream,
-    )
+    if llm is None:
+        llm = ChatOpenAI(
+            model=model_name or settings.default_model,
+            openai_api_key=settings.api_key,
+            temperature=settings.temperature,
+            max_tokens=settings.max_tokens,
+            top_p=settings.top_p,
+            streaming=stream,
+        )
 
     # 3) QA Chain (retorna docs também)
+    if chain_type not in CHAIN_TYPE_KWARGS:
+        raise ValueError(f"chain_type inválido: {chain_type!r} (use {', '.join(CHAIN_TYPE_KWARGS)}).")
     qa = SafeRetrievalQA.from_chain_type(
         llm=llm,
         chain_type=chain_type,
         retriever=retriever,
         return_source_documents=True,
-        chain_type_kwargs={"prompt": PROMPT},
+        chain_type_kwargs=CHAIN_TYPE_KWARGS[chain_type],
+        max_concurrency=max_concurrency,
+        map_token_max=map_token_max,
     )
 
     return qa
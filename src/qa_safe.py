@@ -1,8 +1,60 @@
+import time
+from typing import List
 from langchain.chains import RetrievalQA
+from langchain.chains.combine_documents.map_reduce import MapReduceDocumentsChain
+from langchain.chains.combine_documents.refine import RefineDocumentsChain
+from langchain.schema import Document
+from langchain_core.callbacks import CallbackManager
+from langchain_core.vectorstores import VectorStoreRetriever
+
+FALLBACK_ANSWER = "Desculpe, não sei essa informação."
+
+
+def is_fallback(text: str) -> bool:
+    """
+    True se `text` é só a resposta de fallback (ignorando espaços, '*' e aspas);
+    respostas com conteúdo que apenas citam o fallback não contam.
+    """
+    return text.strip().replace("*", "").replace('"', "").strip() == FALLBACK_ANSWER
+
+
+def pack_documents(docs: List[Document], token_max: int, count_tokens) -> List[Document]:
+    """
+    Agrupa trechos consecutivos (mantendo a ordem de relevância) enquanto couberem
+    em `token_max`, para gastar menos chamadas de LLM no map/refine.
+    Args:
+        docs (List[Document]): Trechos recuperados.
+        token_max (int): Orçamento de tokens por pacote.
+        count_tokens: Função texto → nº de tokens (ex.: llm.get_num_tokens).
+    Returns:
+        List[Document]: Pacotes; metadata['ids'] lista os ids dos trechos.
+    """
+    packs: List[Document] = []
+    texts: List[str] = []
+    ids: list = []
+    used = 0
+    for d in docs:
+        n = count_tokens(d.page_content)
+        if texts and used + n > token_max:
+            packs.append(Document(page_content="\n\n".join(texts), metadata={"ids": ids}))
+            texts, ids, used = [], [], 0
+        texts.append(d.page_content)
+        ids.append(d.metadata.get("id"))
+        used += n
+    if texts:
+        packs.append(Document(page_content="\n\n".join(texts), metadata={"ids": ids}))
+    return packs
 
 
 class SafeRetrievalQA(RetrievalQA):
-    """RetrievalQA que devolve fallback padronizado quando não há contexto."""
+    """
+    RetrievalQA que devolve fallback padronizado quando não há contexto.
+    Em 'map_reduce' roda o map em paralelo (até `max_concurrency` chamadas) sobre
+    pacotes de até `map_token_max` tokens; em 'refine' também empacota os trechos.
+    """
+    max_concurrency: int = 4
+    map_token_max: int = 3000
+
     # ↓ Mantém a factory de conveniência da classe‑mãe
     @classmethod
     def from_chain_type(cls, *args, **kwargs):  # type: ignore[override]
@@ -10,25 +62,110 @@ class SafeRetrievalQA(RetrievalQA):
         qa.__class__ = cls
         return qa
 
+    def _get_docs(self, question: str, *, run_manager=None):
+        """
+        Mesma busca do retriever, mas guardando o score de cada chunk em
+        metadata['score'] (usado nos traces). Retrievers que não expõem
+        score caem no caminho padrão da RetrievalQA. Como a busca com score
+        não passa por retriever.invoke, o início/fim/erro da recuperação é
+        reportado aqui aos callbacks filhos de `run_manager`.
+        """
+        retriever = self.retriever
+        if not isinstance(retriever, VectorStoreRetriever):
+            return super()._get_docs(question, run_manager=run_manager)
+
+        vs = retriever.vectorstore
+        kwargs = dict(retriever.search_kwargs)
+        if retriever.search_type == "similarity_score_threshold":
+            def search():
+                return vs.similarity_search_with_relevance_scores(question, **kwargs)
+        elif retriever.search_type == "mmr" and hasattr(vs, "max_marginal_relevance_search_with_score_by_vector"):
+            def search():
+                embedding = vs.embeddings.embed_query(question)
+                return vs.max_marginal_relevance_search_with_score_by_vector(embedding, **kwargs)
+        else:
+            return super()._get_docs(question, run_manager=run_manager)
+
+        callback_manager = CallbackManager.configure(
+            run_manager.get_child() if run_manager else None,
+            None,
+            local_tags=retriever.tags,
+            local_metadata=retriever.metadata,
+        )
+        retriever_run = callback_manager.on_retriever_start(None, question, name=retriever.get_name())
+        try:
+            scored = search()
+        except Exception as exc:
+            retriever_run.on_retriever_error(exc)
+            raise
+
+        for doc, score in scored:
+            doc.metadata["score"] = score
+        docs = [doc for doc, _ in scored]
+        retriever_run.on_retriever_end(docs)
+        return docs
+
     def _call(self, inputs: dict, run_manager=None):        # noqa: N802
         tone = inputs.pop("tone", "objetivo")
         question = inputs[self.input_key]
 
+        t0 = time.perf_counter()
         docs = self._get_docs(question, run_manager=run_manager)
-        chain_inputs = {
-            "input_documents": docs,
-            "question": question,
-            "tone": tone,
-        }
-        invoke_result = self.combine_documents_chain.invoke(
-            chain_inputs,
-            callbacks=run_manager.get_child() if run_manager else None,
-        )
-        answer = invoke_result["output_text"]
+        t1 = time.perf_counter()
+        callbacks = run_manager.get_child() if run_manager else None
+        combine = self.combine_documents_chain
+        if not docs:
+            answer = FALLBACK_ANSWER
+        elif isinstance(combine, MapReduceDocumentsChain):
+            answer = self._map_reduce(docs, question, tone, callbacks)
+        else:
+            if isinstance(combine, RefineDocumentsChain):
+                docs_in = pack_documents(docs, self.map_token_max, combine.initial_llm_chain.llm.get_num_tokens)
+            else:
+                docs_in = docs
+            chain_inputs = {
+                "input_documents": docs_in,
+                "question": question,
+                "tone": tone,
+            }
+            invoke_result = combine.invoke(chain_inputs, callbacks=callbacks)
+            answer = invoke_result["output_text"]
+        t2 = time.perf_counter()
 
-        out = {"result": answer}
+        out = {"result": answer, "timings": {"retrieve": t1 - t0, "generate": t2 - t1}}
         if self.return_source_documents:
             out["source_documents"] = docs
-        if not docs:
-            out["result"] = "Desculpe, não sei essa informação."
         return out
+
+    def _map_reduce(self, docs: List[Document], question: str, tone: str, callbacks) -> str:
+        """
+        Map em paralelo sobre os pacotes de trechos + reduce das respostas parciais.
+        Pacotes sem resposta (fallback) são descartados antes do reduce; com um
+        único pacote útil, a resposta dele já é a final.
+        """
+        chain = self.combine_documents_chain
+        map_chain = chain.llm_chain
+        packs = pack_documents(docs, self.map_token_max, map_chain.llm.get_num_tokens)
+        results = map_chain.batch(
+            [
+                {chain.document_variable_name: p.page_content, "question": question, "tone": tone}
+                for p in packs
+            ],
+            config={"callbacks": callbacks, "max_concurrency": self.max_concurrency},
+        )
+        partial = [
+            Document(page_content=r[map_chain.output_key].strip(), metadata=p.metadata)
+            for r, p in zip(results, packs)
+            if not is_fallback(r[map_chain.output_key])
+        ]
+        if not partial:
+            return FALLBACK_ANSWER
+        if len(partial) == 1:
+            return partial[0].page_content
+        answer, _ = chain.reduce_documents_chain.combine_docs(
+            partial,
+            callbacks=callbacks,
+            question=question,
+            tone=tone,
+        )
+        return answer
@@ -0,0 +1,297 @@
+from __future__ import annotations
+import gc
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from langchain_openai.chat_models import _client_utils as openai_client_utils
+from langchain_openai.chat_models.base import BaseChatOpenAI
+from langchain_qdrant import QdrantVectorStore
+from src.tracing import traced_invoke, record_trace
+from src.utils.tone import TONES, preload_tone_matchers
+from src.vector_store import reconnect_vectorstore
+
+log = logging.getLogger(__name__)
+
+# Estado do processo que atende (worker ou processo único)
+_rag = None
+_boot_time: float = time.monotonic()
+_ready_after: Optional[float] = None
+
+# Maior corpo aceito em POST /ask (uma pergunta cabe com folga)
+_MAX_BODY_BYTES = 64 * 1024
+
+# Recriação de workers: quem morre antes de _RESPAWN_MIN_UPTIME conta como falha
+# rápida (ex.: Qdrant fora do ar no reconnect) e espera em backoff exponencial;
+# após _RESPAWN_MAX_FAST_FAILURES seguidas, o slot é abandonado.
+_RESPAWN_MIN_UPTIME = 10.0
+_RESPAWN_BACKOFF_BASE = 1.0
+_RESPAWN_BACKOFF_MAX = 30.0
+_RESPAWN_MAX_FAST_FAILURES = 5
+
+
+class RAGRequestHandler(BaseHTTPRequestHandler):
+    """
+    Endpoints HTTP:
+        GET  /health → processo vivo.
+        GET  /ready  → chain carregada e conexões do worker prontas (503 se não).
+        POST /ask    → {"question": "...", "tone": opcional} → resposta + fontes + tempos.
+                       `tone` vai para o prompt, então só um dos TONES é aceito;
+                       sem ele, o tom é detectado pela pergunta.
+    """
+    server_version = "RAGReforma/1.0"
+
+    def do_GET(self) -> None:  # noqa: N802
+        if self.path == "/health":
+            self._json(200, {"status": "ok", "pid": os.getpid()})
+        elif self.path == "/ready":
+            if _ready_after is None:
+                self._json(503, {"ready": False, "pid": os.getpid()})
+            else:
+                self._json(200, {"ready": True, "pid": os.getpid(), "ready_s": _ready_after})
+        else:
+            self._json(404, {"error": "not found"})
+
+    def do_POST(self) -> None:  # noqa: N802
+        if self.path != "/ask":
+            self._json(404, {"error": "not found"})
+            return
+        if _ready_after is None:
+            self._json(503, {"error": "worker ainda não está pronto"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._json(400, {"error": "Content-Length inválido"})
+            return
+        if length > _MAX_BODY_BYTES:
+            self._json(413, {"error": f"corpo maior que {_MAX_BODY_BYTES} bytes"})
+            return
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+            question = str(body.get("question", "")).strip()
+            tone = body.get("tone")
+        except (ValueError, AttributeError):
+            self._json(400, {"error": "JSON inválido"})
+            return
+        if not question:
+            self._json(400, {"error": "campo 'question' obrigatório"})
+            return
+        if tone is not None and tone not in TONES:
+            self._json(400, {"error": "campo 'tone' inválido", "tones": list(TONES)})
+            return
+
+        try:
+            result, trace = traced_invoke(_rag, question, tone=tone)
+        except Exception as exc:
+            log.exception("Erro ao responder pergunta: %s", exc)
+            self._json(500, {"error": "erro interno"})
+            return
+        record_trace(trace)
+        self._json(200, {
+            "answer": result["result"],
+            "tone": trace["tone"],
+            "sources": trace["docs"],
+            "timings": trace["timings"],
+        })
+
+    def log_message(self, format: str, *args) -> None:  # noqa: A002
+        log.debug("%s - %s", self.address_string(), format % args)
+
+    def _json(self, status: int, payload: dict) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            log.debug("Cliente %s desconectou antes da resposta.", self.address_string())
+
+
+def _chain_llms(rag) -> list:
+    """LLMs usados pela chain de combinação (stuff, map_reduce ou refine), sem repetição."""
+    combine = rag.combine_documents_chain
+    chains = [getattr(combine, attr, None) for attr in ("llm_chain", "initial_llm_chain", "refine_llm_chain")]
+    reduce = getattr(combine, "reduce_documents_chain", None)
+    if reduce is not None:
+        chains.append(getattr(reduce.combine_documents_chain, "llm_chain", None))
+    llms = {id(c.llm): c.llm for c in chains if c is not None}
+    return list(llms.values())
+
+
+def _reconnect(rag):
+    """
+    Dá ao worker conexões próprias: o cliente Qdrant e o embedder do pai são
+    trocados por novos, e o cliente HTTP do ChatOpenAI também. O langchain_openai
+    guarda um httpx.Client por processo (lru_cache) compartilhado por todo
+    ChatOpenAI, inclusive o de detect_tone_llm; se o pai já tiver chamado a API,
+    os sockets do pool seriam herdados por todos os workers. Por isso o cache é
+    limpo e os clientes da chain são recriados.
+    """
+    store = rag.retriever.vectorstore
+    if isinstance(store, QdrantVectorStore):
+        rag.retriever.vectorstore = reconnect_vectorstore(store.collection_name)
+
+    openai_client_utils._cached_sync_httpx_client.cache_clear()
+    openai_client_utils._cached_async_httpx_client.cache_clear()
+    for llm in _chain_llms(rag):
+        if isinstance(llm, BaseChatOpenAI):
+            llm.client = llm.async_client = llm.root_client = llm.root_async_client = None
+            llm.validate_environment()
+    return rag
+
+
+def _run_worker(sock: socket.socket, rag, *, reconnect: bool) -> None:
+    """
+    Atende requisições no socket compartilhado até receber SIGTERM/SIGINT.
+    Args:
+        sock (socket.socket): Socket de escuta criado pelo pai (não bloqueante).
+        rag: Chain já construída.
+        reconnect (bool): Se True, recria as conexões de rede (worker após fork).
+    """
+    global _rag, _ready_after
+    _rag = _reconnect(rag) if reconnect else rag
+
+    server = ThreadingHTTPServer(sock.getsockname()[:2], RAGRequestHandler, bind_and_activate=False)
+    server.socket.close()
+    server.socket = sock
+    server.daemon_threads = True
+
+    def _shutdown(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    _ready_after = time.monotonic() - _boot_time
+    log.info("Worker %d pronto em %.2fs.", os.getpid(), _ready_after)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def serve(
+    rag,
+    *,
+    host: str = "0.0.0.0",
+    port: int = 8000,
+    workers: Optional[int] = None,
+    boot_time: Optional[float] = None,
+) -> None:
+    """
+    Serve a chain via HTTP em modo pre-fork.
+
+    O processo pai já fez a sincronização do índice e construiu a chain; aqui
+    ele compila os matchers de tom, abre o socket, congela o heap (gc.freeze,
+    para o GC não sujar páginas compartilhadas) e faz fork de `workers`
+    processos. Os workers herdam tudo copy-on-write, abrem suas próprias
+    conexões e aceitam no mesmo socket. O pai só supervisiona e recria
+    workers que morrerem, com backoff exponencial quando morrem logo após
+    subir; um slot que falha rápido várias vezes seguidas é abandonado e,
+    sem nenhum worker restante, o servidor encerra com RuntimeError.
+    Sem os.fork (Windows) ou com workers=1, atende no próprio processo.
+    Args:
+        rag: Chain criada por create_qa_chain.
+        host (str): Interface de escuta.
+        port (int): Porta HTTP.
+        workers (Optional[int]): Nº de processos (padrão: nº de CPUs).
+        boot_time (Optional[float]): time.monotonic() do início do processo,
+            para o /ready reportar o tempo até ficar pronto.
+    """
+    global _boot_time
+    if boot_time is not None:
+        _boot_time = boot_time
+    workers = workers or os.cpu_count() or 1
+
+    preload_tone_matchers()
+    sock = socket.create_server((host, port), backlog=128)
+    # Vários processos esperam no mesmo socket: quem perder a corrida do accept
+    # recebe BlockingIOError (ignorado pelo socketserver) em vez de travar.
+    sock.setblocking(False)
+    log.info("Servindo em http://%s:%d com %d worker(s).", host, port, workers)
+
+    if workers == 1 or not hasattr(os, "fork"):
+        if workers > 1:
+            log.warning("os.fork indisponível nesta plataforma: usando 1 processo.")
+        _run_worker(sock, rag, reconnect=False)
+        return
+
+    gc.freeze()
+    parent_pid = os.getpid()
+    children: Dict[int, int] = {}      # pid → slot
+    started: Dict[int, float] = {}     # slot → início do worker atual
+    failures: Dict[int, int] = {}      # slot → falhas rápidas seguidas
+    pending: Dict[int, float] = {}     # slot → quando recriar
+    stopping = False
+
+    def _spawn(slot: int) -> None:
+        started[slot] = time.monotonic()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_worker(sock, rag, reconnect=True)
+            except Exception:
+                log.exception("Worker %d (slot %d) falhou.", os.getpid(), slot)
+                sys.exit(1)
+            sys.exit(0)
+        children[pid] = slot
+
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    try:
+        for slot in range(workers):
+            _spawn(slot)
+        while not stopping:
+            now = time.monotonic()
+            for slot, due in list(pending.items()):
+                if due <= now:
+                    del pending[slot]
+                    _spawn(slot)
+            if not children and not pending:
+                raise RuntimeError("Todos os workers falharam repetidamente ao subir; servidor encerrado.")
+            pid, status = os.waitpid(-1, os.WNOHANG) if children else (0, 0)
+            if pid == 0:
+                time.sleep(0.5)
+                continue
+            slot = children.pop(pid, None)
+            if slot is None or stopping:
+                continue
+            fast = time.monotonic() - started[slot] < _RESPAWN_MIN_UPTIME
+            failures[slot] = failures.get(slot, 0) + 1 if fast else 0
+            if failures[slot] >= _RESPAWN_MAX_FAST_FAILURES:
+                log.error("Worker %d (slot %d) falhou %d vezes seguidas logo após subir; slot abandonado.",
+                          pid, slot, failures[slot])
+                continue
+            delay = min(_RESPAWN_BACKOFF_MAX, _RESPAWN_BACKOFF_BASE * 2 ** (failures[slot] - 1)) if fast else 0.0
+            log.warning("Worker %d saiu (status %d); recriando em %.1fs.", pid, status, delay)
+            pending[slot] = time.monotonic() + delay
+    finally:
+        # SystemExit dos workers também passa por aqui: só o pai encerra os filhos
+        if os.getpid() == parent_pid:
+            for pid in children:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+            for pid in children:
+                try:
+                    os.waitpid(pid, 0)
+                except ChildProcessError:
+                    pass
+            sock.close()
+            log.info("Servidor encerrado.")
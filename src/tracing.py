@@ -0,0 +1,91 @@
+from __future__ import annotations
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+from langchain_community.callbacks import get_openai_callback
+from src.config import settings
+from src.utils.bg_writer import BackgroundWriter, list_segments
+from src.utils.tone import detect_tone
+
+log = logging.getLogger(__name__)
+
+_trace_writer = BackgroundWriter(
+    settings.trace_log,
+    max_bytes=settings.trace_log_max_bytes,
+    backup_count=settings.trace_log_backup_count,
+)
+
+
+def traced_invoke(rag, question: str, tone: Optional[str] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Executa uma pergunta na chain medindo cada etapa.
+    Args:
+        rag: Chain criada por create_qa_chain.
+        question (str): Pergunta do usuário.
+        tone (Optional[str]): Tom já conhecido (ex.: replay); se None, roda detect_tone.
+    Returns:
+        Tuple[dict, dict]: (resultado da chain, registro de trace).
+    """
+    ts = time.time()
+    t0 = time.perf_counter()
+    with get_openai_callback() as cb:
+        if tone is None:
+            tone = detect_tone(question)
+        t1 = time.perf_counter()
+        result = rag.invoke({"query": question, "tone": tone})
+    t2 = time.perf_counter()
+
+    stages = result.get("timings", {})
+    record = {
+        "ts": ts,
+        "question": question,
+        "tone": tone,
+        "docs": [
+            {"id": d.metadata.get("id"), "score": d.metadata.get("score")}
+            for d in result.get("source_documents", [])
+        ],
+        "timings": {
+            "tone": t1 - t0,
+            "retrieve": stages.get("retrieve"),
+            "generate": stages.get("generate"),
+            "total": t2 - t0,
+        },
+        "tokens": {
+            "prompt": cb.prompt_tokens,
+            "completion": cb.completion_tokens,
+            "total": cb.total_tokens,
+        },
+    }
+    return result, record
+
+
+def record_trace(record: Dict[str, Any]) -> None:
+    """
+    Enfileira o trace para gravação em background (uma linha JSON por pergunta).
+    Args:
+        record (dict): Registro retornado por traced_invoke.
+    """
+    _trace_writer.write(json.dumps(record, ensure_ascii=False))
+
+
+def load_traces(path: Path | str = settings.trace_log) -> Iterator[Dict[str, Any]]:
+    """
+    Lê os traces gravados, incluindo segmentos já rotacionados, em ordem cronológica.
+    Args:
+        path (Path | str): Arquivo ativo de traces.
+    Yields:
+        dict: Um registro por pergunta.
+    """
+    path = Path(path)
+    files = list_segments(path) + ([path] if path.exists() else [])
+    for file in files:
+        with open(file, encoding="utf-8") as f:
+            for n, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    log.warning("Trace inválido em %s:%d (ignorado).", file, n)
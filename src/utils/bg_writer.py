@@ -0,0 +1,199 @@
+from __future__ import annotations
+import atexit
+import logging
+import os
+import queue
+import re
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+log = logging.getLogger(__name__)
+
+SEGMENT_TS_FMT = "%Y%m%dT%H%M%S%f"
+_SEGMENT_TS_RE = re.compile(r"^\d{8}T\d{12}$")
+
+
+def segment_path(path: Path, when: datetime) -> Path:
+    """
+    Nome do segmento fechado gerado na rotação de `path`.
+    Ex.: logs/tone_llm_cases.txt → logs/tone_llm_cases.20260101T120000000000.txt
+    Args:
+        path (Path): Arquivo ativo.
+        when (datetime): Momento da rotação.
+    Returns:
+        Path: Caminho do segmento.
+    """
+    return path.with_name(f"{path.stem}.{when.strftime(SEGMENT_TS_FMT)}{path.suffix}")
+
+
+def list_segments(path: Path) -> List[Path]:
+    """
+    Lista os segmentos já rotacionados de `path`, em ordem cronológica.
+    O arquivo ativo não entra na lista.
+    Args:
+        path (Path): Arquivo ativo.
+    Returns:
+        List[Path]: Segmentos fechados, do mais antigo ao mais novo.
+    """
+    path = Path(path)
+    segs = []
+    for p in path.parent.glob(f"{path.stem}.*{path.suffix}"):
+        ts = p.name[len(path.stem) + 1: len(p.name) - len(path.suffix)]
+        if _SEGMENT_TS_RE.match(ts):
+            segs.append(p)
+    return sorted(segs)
+
+
+class BackgroundWriter:
+    """
+    Escritor de linhas em arquivo fora do caminho da requisição.
+
+    `write` só enfileira (nunca bloqueia; se a fila encher, a linha é descartada
+    e contada em `dropped`). Uma thread daemon drena a fila em lotes, grava com
+    um único open/append por lote e rotaciona o arquivo quando passa de
+    `max_bytes`, renomeando-o para um segmento com timestamp (ver `segment_path`)
+    e apagando os segmentos mais antigos além dos `backup_count` mais recentes.
+    Como o arquivo é reaberto a cada lote e cada lote vai num único write() em
+    modo O_APPEND, vários processos (workers) podem escrever e rotacionar o
+    mesmo caminho sem intercalar linhas.
+    """
+
+    def __init__(
+        self,
+        path: Path | str,
+        *,
+        max_bytes: int = 5 * 1024 * 1024,
+        backup_count: int = 10,
+        flush_interval: float = 1.0,
+        max_queue: int = 10_000,
+    ) -> None:
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._atexit_registered = False
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    # ── API pública ─────────────────────────────────────────────
+    def write(self, line: str) -> None:
+        """
+        Enfileira uma linha para gravação assíncrona.
+        Args:
+            line (str): Conteúdo da linha (o '\\n' final é acrescentado se faltar).
+        """
+        self._ensure_started()
+        if not line.endswith("\n"):
+            line += "\n"
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self) -> None:
+        """Bloqueia até que tudo o que já foi enfileirado esteja no disco."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """
+        Grava o que restou na fila e encerra a thread de escrita.
+        Args:
+            timeout (float): Tempo máximo de espera pela thread.
+        """
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            log.warning("BackgroundWriter(%s): fila cheia ao encerrar.", self.path)
+            return
+        thread.join(timeout)
+        if self.dropped:
+            log.warning("BackgroundWriter(%s): %d linhas descartadas.", self.path, self.dropped)
+
+    # ── Internos ────────────────────────────────────────────────
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run,
+                name=f"bg-writer:{self.path.name}",
+                daemon=True,
+            )
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.close)
+                self._atexit_registered = True
+
+    def _reset_after_fork(self) -> None:
+        # A thread do pai não existe no filho: começa com fila e lock novos
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.dropped = 0
+
+    def _run(self) -> None:
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [first]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = [line for line in batch if line is not None]
+            try:
+                if lines:
+                    self._write_batch(lines)
+            except OSError as exc:
+                log.warning("BackgroundWriter(%s) falhou: %s", self.path, exc)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+            if len(lines) != len(batch):  # sentinela de encerramento
+                return
+
+    def _write_batch(self, lines: List[str]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Um único write() sem buffer: com O_APPEND o lote entra inteiro no fim do
+        # arquivo, mesmo com outros processos gravando (um TextIOWrapper quebraria
+        # lotes acima de 8 KiB em vários write() no meio das linhas).
+        data = memoryview("".join(lines).encode("utf-8"))
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            while data:
+                data = data[os.write(fd, data):]
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        if self.max_bytes and size >= self.max_bytes:
+            try:
+                os.replace(self.path, segment_path(self.path, datetime.now()))
+            except FileNotFoundError:
+                pass  # outro processo (worker) já rotacionou
+            self._prune_segments()
+
+    def _prune_segments(self) -> None:
+        if self.backup_count <= 0:
+            return
+        for seg in list_segments(self.path)[:-self.backup_count]:
+            try:
+                seg.unlink()
+            except FileNotFoundError:
+                pass  # outro processo (worker) já apagou
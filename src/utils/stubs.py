@@ -0,0 +1,31 @@
+"""
+Backends falsos (sem Qdrant/OpenAI) compartilhados pelos testes offline e
+pelos modos --stub de tools/replay_traces.py e tools/bench_serve.py.
+"""
+import time
+from langchain_core.language_models import SimpleChatModel
+from langchain_core.vectorstores import InMemoryVectorStore
+
+
+class StubChatModel(SimpleChatModel):
+    """LLM falso: espera `latency` segundos e devolve resposta fixa (sem custo de API)."""
+    latency: float = 0.0
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs) -> str:
+        time.sleep(self.latency)
+        return "Resposta simulada."
+
+    def get_num_tokens(self, text: str) -> int:
+        # aproximação sem tokenizer (o padrão do LangChain exige transformers)
+        return len(text.split())
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-chat"
+
+
+class StubVectorStore(InMemoryVectorStore):
+    """Vetor em memória com a similaridade de cosseno (‑1..1) mapeada para relevância 0‑1."""
+
+    def _select_relevance_score_fn(self):
+        return lambda score: (score + 1) / 2
@@ -1,39 +1,137 @@
 import re
+import json
 import unicodedata
 import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Pattern, Tuple
 from langchain_openai import ChatOpenAI
 from src.config import settings
+from src.utils.bg_writer import BackgroundWriter
 
 log = logging.getLogger(__name__)
 
 
+# Termos fixos por tom, na ordem de prioridade da classificação local.
+# Os termos minerados por tools/minerar_tone.py são somados a estes.
+BASE_TERMS: Dict[str, Tuple[str, ...]] = {
+    "irritado e conciso": (
+        "absurdo", "ridiculo", "ridículo", "palhaçada", "roubo", "nojento", "vergonha", "mentira",
+        "mentiroso", "sacanagem", "falta de respeito", "não aguento", "ladrão", "indignado"
+    ),
+    "informal e descontraído": (
+        "mano", "mona", "bixa", "amigo", "amiga", "véi", "velho", "cara", "porra", "tipo", "mó", "tô", "sai fora", "aff", "vish", "top",
+        "massa", "zika", "bora", "falae", "tmj", "parça", "kkk", "rs", "meu", "oxe", "véa", "véio", "kk", "rsrs"
+    ),
+    "formal e polido": (
+        "por favor", "gentileza", "poderia", "agradeço", "cordialmente", "atenciosamente", "fico no aguardo",
+        "seria possível", "obrigado", "obrigada", "grato", "grata", "gostaria", "aprecio", "saudações"
+    ),
+}
+# Todos os tons aceitos pelos prompts (os de BASE_TERMS + o padrão)
+TONES: Tuple[str, ...] = (*BASE_TERMS, "objetivo")
+_IRRITADO_RE = re.compile(r"!{2,}|[😡🤬🤯]")
+
+# Cache dos matchers compilados, invalidado pelo caminho + mtime da tabela minerada
+_matchers: List[Tuple[str, Pattern[str], Optional[Pattern[str]]]] = []
+_matchers_key: Optional[Tuple[Path, Optional[float]]] = None
+
+_case_writer = BackgroundWriter(
+    settings.tone_cases_log,
+    max_bytes=settings.tone_log_max_bytes,
+    backup_count=settings.tone_log_backup_count,
+)
+
+
+def _normalize(txt: str) -> str:
+    return unicodedata.normalize("NFKD", txt.lower())
+
+
+def _strip_accents(txt: str) -> str:
+    # Mesma forma dos termos gravados por tools/minerar_tone.py
+    return "".join(c for c in _normalize(txt) if not unicodedata.combining(c))
+
+
+def _alternation(terms) -> str:
+    # termos maiores primeiro: a alternância do regex para no primeiro que casar
+    return "|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True))
+
+
+def _load_mined_terms(path: Path) -> Dict[str, List[str]]:
+    """
+    Lê a tabela {tom: [termos]} gerada por tools/minerar_tone.py.
+    Args:
+        path (Path): Caminho do JSON.
+    Returns:
+        Dict[str, List[str]]: Tabela minerada (vazia se ausente ou inválida).
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as exc:
+        log.warning(f"Tabela de tom inválida em {path}: {exc}")
+        return {}
+    return {str(k).lower(): [str(t) for t in v] for k, v in data.items() if isinstance(v, list)}
+
+
+def _tone_matchers() -> List[Tuple[str, Pattern[str], Optional[Pattern[str]]]]:
+    """
+    Devolve [(tom, regex dos termos fixos, regex dos minerados)], recompilando só
+    quando a tabela minerada (caminho ou mtime) muda. Os termos fixos casam como substring
+    do texto NFKD; os minerados só como palavra inteira (\\b) no texto sem acentos,
+    para um termo curto não casar dentro de outra palavra ('ai' em 'saída').
+    """
+    global _matchers, _matchers_key
+    path = Path(settings.tone_keywords_file)
+    try:
+        mtime: Optional[float] = path.stat().st_mtime
+    except OSError:
+        mtime = None
+    if (path, mtime) == _matchers_key:
+        return _matchers
+
+    mined = _load_mined_terms(path) if mtime is not None else {}
+    matchers = []
+    for tone, base in BASE_TERMS.items():
+        base_re = re.compile(_alternation({_normalize(t) for t in base}))
+        extra = {_strip_accents(t.strip()) for t in mined.get(tone, ()) if t.strip()}
+        mined_re = re.compile(rf"\b(?:{_alternation(extra)})\b") if extra else None
+        matchers.append((tone, base_re, mined_re))
+    _matchers, _matchers_key = matchers, (path, mtime)
+    return matchers
+
+
+def preload_tone_matchers() -> int:
+    """
+    Compila os matchers de tom antecipadamente (ex.: no processo pai antes do fork,
+    para que os workers herdem os regex já prontos).
+    Returns:
+        int: Quantidade de tons com matcher compilado.
+    """
+    return len(_tone_matchers())
+
+
 def detect_tone_local(msg: str) -> str:
     """
-    Detecta o tom da mensagem com base em padrões, gírias e palavras-chave conhecidas.
+    Detecta o tom da mensagem com base em padrões, gírias e palavras-chave conhecidas
+    (termos fixos + tabela minerada dos casos da LLM).
     Args:
         msg (str): Texto da pergunta do usuário.
     Returns:
         str:Um dos tons ('irritado e conciso', 'informal e descontraído', 'formal e polido', 'objetivo').
     """
-    txt = unicodedata.normalize("NFKD", msg.lower())
-    # Irritado
-    if re.search(r"!{2,}|[😡🤬🤯]", msg) or any(w in txt for w in (
-        "absurdo", "ridiculo", "ridículo", "palhaçada", "roubo", "nojento", "vergonha", "mentira",
-        "mentiroso", "sacanagem", "falta de respeito", "não aguento", "ladrão", "indignado"
-    )):
+    if _IRRITADO_RE.search(msg):
         return "irritado e conciso"
-    # Informal
-    if any(g in txt for g in (
-        "mano", "mona", "bixa", "amigo", "amiga", "véi", "velho", "cara", "porra", "tipo", "mó", "tô", "sai fora", "aff", "vish", "top",
-        "massa", "zika", "bora", "falae", "tmj", "parça", "kkk", "rs", "meu", "oxe", "véa", "véio", "kk", "rsrs"
-    )):
-        return "informal e descontraído"
-    # Formal/polido
-    if any(w in txt for w in (
-        "por favor", "gentileza", "poderia", "agradeço", "cordialmente", "atenciosamente", "fico no aguardo",
-        "seria possível", "obrigado", "obrigada", "grato", "grata", "gostaria", "aprecio", "saudações"
-    )):
-        return "formal e polido"
+    txt = _normalize(msg)
+    plain = None
+    for tone, base_re, mined_re in _tone_matchers():
+        if base_re.search(txt):
+            return tone
+        if mined_re is not None:
+            plain = plain if plain is not None else _strip_accents(msg)
+            if mined_re.search(plain):
+                return tone
     return "objetivo"
 
 
@@ -90,8 +188,9 @@ def detect_tone(msg: str) -> str:
     if tone == "objetivo":
         tone_llm = detect_tone_llm(msg)
         if tone_llm != "objetivo":
-            with open("logs/tone_llm_cases.txt", "a", encoding="utf-8") as f:
-                f.write(f"TOM: {tone_llm.upper()} | MSG: {msg.strip()}\n")
+            # Grava em background: o log alimenta tools/minerar_tone.py
+            clean = " ".join(msg.split())
+            _case_writer.write(f"TOM: {tone_llm.upper()} | MSG: {clean}")
             log.info(f"Tone LLM detectou '{tone_llm}' para: {msg.strip()}")
         return tone_llm
     return tone
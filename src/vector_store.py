@@ -10,7 +10,8 @@ from src.config import settings
 import logging
 
 log = logging.getLogger(__name__)
-_client = QdrantClient(url="http://localhost:6333", timeout=30, api_key=settings.qdrant_api_key)
+QDRANT_URL = "http://localhost:6333"
+_client = QdrantClient(url=QDRANT_URL, timeout=30, api_key=settings.qdrant_api_key)
 
 
 def _ensure_collection(collection: str):
@@ -107,3 +108,19 @@ def initialize_vectorstore(
         log.info("Qdrant: índice já atualizado (0 chunks novos).")
 
     return store
+
+
+def reconnect_vectorstore(collection_name: str = "reforma_tributaria") -> QdrantVectorStore:
+    """
+    Recria o cliente Qdrant e o embedder no processo atual e devolve um store
+    para a coleção já existente (sem varrer IDs nem indexar).
+    Usado por cada worker após o fork: as conexões abertas pelo processo pai
+    não podem ser compartilhadas, então cada worker monta seu próprio pool.
+    Args:
+        collection_name (str): Nome da coleção já sincronizada pelo processo pai.
+    Returns:
+        QdrantVectorStore: Instância com cliente próprio do processo.
+    """
+    global _client
+    _client = QdrantClient(url=QDRANT_URL, timeout=30, api_key=settings.qdrant_api_key)
+    return _new_store(collection_name)
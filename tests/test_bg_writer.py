@@ -0,0 +1,91 @@
+import sys
+import pathlib
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+import os
+import pytest
+from datetime import datetime, timedelta
+from src.utils.bg_writer import BackgroundWriter, list_segments, segment_path
+
+
+def test_writer_rotates_into_ordered_segments(tmp_path):
+    path = tmp_path / "casos.txt"
+    writer = BackgroundWriter(path, max_bytes=10, flush_interval=0.05)
+    for i in range(3):
+        writer.write(f"linha {i} com mais de dez bytes")
+        writer.flush()
+    writer.close()
+
+    segs = list_segments(path)
+    assert len(segs) == 3
+    assert not path.exists()  # cada lote passou do limite e foi rotacionado
+    assert [s.read_text(encoding="utf-8") for s in segs] == [
+        f"linha {i} com mais de dez bytes\n" for i in range(3)
+    ]
+
+
+def test_rotation_keeps_only_backup_count_newest_segments(tmp_path):
+    path = tmp_path / "casos.txt"
+    writer = BackgroundWriter(path, max_bytes=10, backup_count=2, flush_interval=0.05)
+    for i in range(5):
+        writer.write(f"linha {i} com mais de dez bytes")
+        writer.flush()
+    writer.close()
+
+    assert [s.read_text(encoding="utf-8") for s in list_segments(path)] == [
+        "linha 3 com mais de dez bytes\n", "linha 4 com mais de dez bytes\n"
+    ]
+
+
+def test_list_segments_is_chronological_and_ignores_other_files(tmp_path):
+    path = tmp_path / "casos.txt"
+    agora = datetime(2026, 1, 1, 12, 0, 0)
+    esperados = [segment_path(path, agora + timedelta(seconds=s)) for s in (0, 1, 60)]
+    for seg in reversed(esperados):
+        seg.write_text("x\n", encoding="utf-8")
+    path.write_text("ativo\n", encoding="utf-8")
+    (tmp_path / "casos.backup.txt").write_text("y\n", encoding="utf-8")
+
+    assert list_segments(path) == esperados
+
+
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="usa os.fork")
+def test_concurrent_processes_never_interleave_lines(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    n_proc, n_lotes, por_lote, largura = 4, 50, 60, 400  # lotes de ~24 KiB, acima do buffer de 8 KiB
+    pids = []
+    for p in range(n_proc):
+        pid = os.fork()
+        if pid == 0:
+            writer = BackgroundWriter(path, max_bytes=0)
+            for lote in range(n_lotes):
+                writer._write_batch([f"{p}:{lote:02d}{i:02d}:" + str(p) * largura + "\n" for i in range(por_lote)])
+            os._exit(0)
+        pids.append(pid)
+    for pid in pids:
+        assert os.waitpid(pid, 0)[1] == 0
+
+    linhas = path.read_text(encoding="utf-8").splitlines()
+    assert len(linhas) == n_proc * n_lotes * por_lote
+    for linha in linhas:
+        p, _, corpo = linha.split(":", 2)
+        assert corpo == p * largura
+
+
+def test_large_batch_goes_out_in_a_single_write(tmp_path, monkeypatch):
+    # é o que garante o O_APPEND atômico entre processos
+    chamadas = []
+    write = os.write
+
+    def espiao(fd, data):
+        chamadas.append(len(data))
+        return write(fd, data)
+
+    monkeypatch.setattr(os, "write", espiao)
+    lote = [f"{i:02d}:" + "x" * 398 + "\n" for i in range(60)]
+    BackgroundWriter(tmp_path / "traces.jsonl", max_bytes=0)._write_batch(lote)
+
+    assert chamadas == [sum(len(linha) for linha in lote)]
+    assert (tmp_path / "traces.jsonl").read_text(encoding="utf-8") == "".join(lote)
@@ -0,0 +1,129 @@
+import sys
+import pathlib
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+import os
+import threading
+import time
+from typing import List
+from pydantic import Field
+from langchain.schema import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+# src.config exige a chave; aqui o LLM é sempre o stub
+os.environ.setdefault("OPENAI_API_KEY", "test")
+from src.qa_chain import create_qa_chain
+from src.qa_safe import FALLBACK_ANSWER, pack_documents
+from src.utils.stubs import StubChatModel, StubVectorStore
+
+TOM = "tom-de-teste"
+
+
+class RecordingChatModel(StubChatModel):
+    """Stub que guarda os prompts, mede a concorrência e responde conforme o trecho."""
+    prompts: List[str] = Field(default_factory=list)
+    active: int = 0
+    peak: int = 0
+    lock: object = Field(default_factory=threading.Lock)
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs) -> str:
+        prompt = messages[-1].content
+        with self.lock:
+            self.prompts.append(prompt)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.latency)
+        with self.lock:
+            self.active -= 1
+        if "RESPOSTAS PARCIAIS" in prompt:
+            return "Resposta combinada."
+        if "SEM RESPOSTA" in prompt:
+            return f'**"{FALLBACK_ANSWER}"**'
+        if "CITA FALLBACK" in prompt:
+            return f"{FALLBACK_ANSWER} Mas o IBS substitui o ICMS."
+        return "Resposta parcial."
+
+
+def make_chain(textos, chain_type="map_reduce", latency=0.0, **kwargs):
+    """Chain com vetor em memória: todos os trechos são recuperados (threshold 0, k = nº de trechos)."""
+    store = StubVectorStore(DeterministicFakeEmbedding(size=64))
+    if textos:
+        store.add_documents([Document(page_content=t, metadata={"id": str(i)}) for i, t in enumerate(textos)])
+    llm = RecordingChatModel(latency=latency)
+    rag = create_qa_chain(
+        store, k=max(len(textos), 1), score_threshold=0.0, chain_type=chain_type, llm=llm, **kwargs
+    )
+    return rag, llm
+
+
+def ask(rag):
+    return rag.invoke({"query": "O que muda com o IBS?", "tone": TOM})["result"]
+
+
+def test_pack_documents_respects_token_budget():
+    docs = [Document(page_content=t, metadata={"id": i}) for i, t in enumerate(
+        ["a b c", "d e f", "g h i", "um trecho grande demais sozinho"]
+    )]
+    packs = pack_documents(docs, 6, lambda t: len(t.split()))
+
+    assert [p.metadata["ids"] for p in packs] == [[0, 1], [2], [3]]
+    assert packs[0].page_content == "a b c\n\nd e f"
+    # só o trecho que sozinho já estoura o orçamento passa do limite
+    assert all(len(p.page_content.split()) <= 6 for p in packs[:2])
+
+
+def test_map_concurrency_is_bounded():
+    rag, llm = make_chain(
+        [f"Trecho {i} sobre IBS" for i in range(8)], latency=0.2, max_concurrency=4, map_token_max=1
+    )
+    assert ask(rag) == "Resposta combinada."
+
+    assert len(llm.prompts) == 9  # 8 maps + 1 reduce
+    # os maps se sobrepõem, mas nunca mais de max_concurrency de uma vez
+    assert 1 < llm.peak <= 4
+
+
+def test_fallback_partials_are_dropped_before_reduce():
+    rag, llm = make_chain(
+        ["Trecho SEM RESPOSTA um", "Trecho CITA FALLBACK dois", "Trecho normal tres"], map_token_max=1
+    )
+    assert ask(rag) == "Resposta combinada."
+
+    reduce_prompt = llm.prompts[-1]
+    parciais = reduce_prompt.split("=== RESPOSTAS PARCIAIS")[1].split("=== FIM")[0]
+    # o parcial que é só o fallback não chega ao reduce; o que só cita o fallback, sim
+    assert "Resposta parcial." in parciais
+    assert f"{FALLBACK_ANSWER} Mas o IBS substitui o ICMS." in parciais
+    assert '**"' not in parciais
+
+
+def test_single_useful_partial_skips_reduce():
+    rag, llm = make_chain(["Trecho SEM RESPOSTA um", "Trecho normal dois"], map_token_max=1)
+
+    assert ask(rag) == "Resposta parcial."
+    assert len(llm.prompts) == 2
+    assert not any("RESPOSTAS PARCIAIS" in p for p in llm.prompts)
+
+
+def test_empty_retrieval_returns_fallback_without_llm_call():
+    for chain_type in ("stuff", "map_reduce", "refine"):
+        rag, llm = make_chain([], chain_type=chain_type)
+        assert ask(rag) == FALLBACK_ANSWER
+        assert llm.prompts == []
+
+
+def test_tone_reaches_map_and_reduce_prompts():
+    rag, llm = make_chain([f"Trecho {i} sobre IBS" for i in range(3)], map_token_max=1)
+    ask(rag)
+
+    assert len(llm.prompts) == 4
+    assert all(f"Adote o tom {TOM}." in p for p in llm.prompts)
+
+
+def test_refine_packs_documents_and_keeps_tone():
+    # 4 trechos de 4 "tokens" com orçamento de 8 → 2 pacotes → 1 chamada inicial + 1 refine
+    rag, llm = make_chain([f"Trecho {i} sobre IBS" for i in range(4)], chain_type="refine", map_token_max=8)
+
+    assert ask(rag) == "Resposta parcial."
+    assert len(llm.prompts) == 2
+    assert "Resposta existente:\nResposta parcial." in llm.prompts[1]
+    assert all(f"Adote o tom {TOM}." in p for p in llm.prompts)
@@ -0,0 +1,119 @@
+import sys
+import pathlib
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / "tools"))
+import os
+import json
+from datetime import datetime
+# src.config exige a chave; nenhum teste daqui chama a OpenAI
+os.environ.setdefault("OPENAI_API_KEY", "test")
+from src.config import settings
+from src.utils.tone import detect_tone_local
+from src.utils.bg_writer import segment_path
+from minerar_tone import atualizar_contadores, carregar_estado, gerar_tabela, salvar_estado, STOPWORDS
+
+LINHA_INFORMAL = "TOM: INFORMAL E DESCONTRAÍDO | MSG: e aí galera, e o imposto?\n"
+LINHA_IRRITADO = "TOM: IRRITADO E CONCISO | MSG: que imposto lixo\n"
+
+
+def escrever(caminho, texto):
+    with open(caminho, "a", encoding="utf-8") as f:
+        f.write(texto)
+    return len(texto.encode("utf-8"))
+
+
+def rodar_miner(log_path, estado_path):
+    """Uma execução do miner: carrega o estado, processa o que é novo e persiste."""
+    estado = carregar_estado(estado_path)
+    lidos = atualizar_contadores(log_path, estado, STOPWORDS)
+    salvar_estado(estado_path, estado)
+    return lidos, estado
+
+
+def test_second_run_processes_nothing(tmp_path):
+    log_path, estado_path = tmp_path / "casos.txt", tmp_path / "estado.json"
+    total = escrever(log_path, LINHA_INFORMAL + LINHA_IRRITADO)
+
+    assert rodar_miner(log_path, estado_path)[0] == total
+    lidos, estado = rodar_miner(log_path, estado_path)
+    assert lidos == 0
+    assert estado["mensagens"]["IRRITADO E CONCISO"] == 1
+
+
+def test_rotated_segment_resumes_from_saved_offset(tmp_path):
+    log_path, estado_path = tmp_path / "casos.txt", tmp_path / "estado.json"
+    escrever(log_path, LINHA_INFORMAL)
+    rodar_miner(log_path, estado_path)
+
+    # chega mais uma linha e o arquivo ativo é rotacionado antes da próxima execução
+    novos = escrever(log_path, LINHA_IRRITADO)
+    os.replace(log_path, segment_path(log_path, datetime.now()))
+    novos += escrever(log_path, LINHA_INFORMAL)
+
+    lidos, estado = rodar_miner(log_path, estado_path)
+    assert lidos == novos
+    assert estado["mensagens"]["INFORMAL E DESCONTRAÍDO"] == 2
+    assert estado["mensagens"]["IRRITADO E CONCISO"] == 1
+    assert estado["contadores"]["INFORMAL E DESCONTRAÍDO"]["galera"] == 2
+
+
+def test_pruned_segments_leave_the_state(tmp_path):
+    log_path, estado_path = tmp_path / "casos.txt", tmp_path / "estado.json"
+    seg = segment_path(log_path, datetime(2026, 1, 1))
+    escrever(seg, LINHA_INFORMAL)
+    assert seg.name in rodar_miner(log_path, estado_path)[1]["segmentos"]
+
+    seg.unlink()  # apagado pela retenção do BackgroundWriter
+    lidos, estado = rodar_miner(log_path, estado_path)
+    assert lidos == 0
+    assert estado["segmentos"] == set()
+
+
+def test_partial_last_line_is_left_for_next_run(tmp_path):
+    log_path, estado_path = tmp_path / "casos.txt", tmp_path / "estado.json"
+    completa = escrever(log_path, LINHA_INFORMAL)
+    escrever(log_path, LINHA_IRRITADO.rstrip("\n"))
+
+    lidos, estado = rodar_miner(log_path, estado_path)
+    assert lidos == completa
+    assert "IRRITADO E CONCISO" not in estado["mensagens"]
+
+    escrever(log_path, "\n")
+    lidos, estado = rodar_miner(log_path, estado_path)
+    assert lidos == len(LINHA_IRRITADO.encode("utf-8"))
+    assert estado["contadores"]["IRRITADO E CONCISO"]["lixo"] == 1
+
+
+def test_table_keeps_only_discriminative_terms(tmp_path):
+    log_path, estado_path = tmp_path / "casos.txt", tmp_path / "estado.json"
+    escrever(log_path, (LINHA_INFORMAL + LINHA_IRRITADO) * 3)
+    _, estado = rodar_miner(log_path, estado_path)
+
+    tabela = gerar_tabela(estado, {"imposto"} | STOPWORDS)
+    # 'imposto' é do domínio e aparece nos dois tons; 'ai' é curto demais
+    assert tabela == {"informal e descontraído": ["galera"], "irritado e conciso": ["lixo"]}
+
+
+def test_mined_terms_match_whole_words_only(tmp_path, monkeypatch):
+    tabela = tmp_path / "tone_keywords.json"
+    tabela.write_text(json.dumps({"informal e descontraído": ["ai", "galera"]}), encoding="utf-8")
+    monkeypatch.setattr(settings, "tone_keywords_file", tabela)
+
+    assert detect_tone_local("Qual a saída para o imposto na reforma?") == "objetivo"
+    assert detect_tone_local("E aí, como fica o imposto?") == "informal e descontraído"
+    assert detect_tone_local("Fala, galera!") == "informal e descontraído"
+    assert detect_tone_local("Galerada do imposto") == "objetivo"
+
+
+def test_matcher_cache_follows_the_table_path(tmp_path, monkeypatch):
+    a, b = tmp_path / "a.json", tmp_path / "b.json"
+    a.write_text(json.dumps({"formal e polido": ["prezados"]}), encoding="utf-8")
+    b.write_text(json.dumps({"formal e polido": ["excelentissimo"]}), encoding="utf-8")
+    os.utime(b, ns=(a.stat().st_atime_ns, a.stat().st_mtime_ns))  # mesmo mtime
+
+    monkeypatch.setattr(settings, "tone_keywords_file", a)
+    assert detect_tone_local("prezados, e o imposto?") == "formal e polido"
+    monkeypatch.setattr(settings, "tone_keywords_file", b)
+    assert detect_tone_local("prezados, e o imposto?") == "objetivo"
+    assert detect_tone_local("excelentíssimo, e o imposto?") == "formal e polido"
@@ -0,0 +1,142 @@
+import sys
+import pathlib
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / "tools"))
+import os
+import json
+from datetime import datetime, timedelta
+import pytest
+from langchain.schema import Document
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import DeterministicFakeEmbedding
+# src.config exige a chave; aqui o LLM é sempre o stub
+os.environ.setdefault("OPENAI_API_KEY", "test")
+import src.tracing as tracing
+from src.qa_chain import create_qa_chain
+from src.tracing import load_traces, traced_invoke
+from src.utils.bg_writer import segment_path
+from src.utils.stubs import StubChatModel, StubVectorStore
+from replay_traces import percentis
+
+PERGUNTA = "O que muda com o IBS?"
+
+
+class ScoredMMRStore(StubVectorStore):
+    """Como o Qdrant: expõe MMR com score por vetor."""
+
+    def max_marginal_relevance_search_with_score_by_vector(self, embedding, k=4, **kwargs):
+        docs = self.max_marginal_relevance_search_by_vector(embedding, k=k)
+        return [(d, 0.9 - i / 10) for i, d in enumerate(docs)]
+
+
+class BrokenStore(StubVectorStore):
+    def similarity_search_with_relevance_scores(self, query, k=4, **kwargs):
+        raise ConnectionError("qdrant fora do ar")
+
+
+class RetrieverEvents(BaseCallbackHandler):
+    def __init__(self):
+        self.events = []
+
+    def on_retriever_start(self, serialized, query, **kwargs):
+        self.events.append(("start", query))
+
+    def on_retriever_end(self, documents, **kwargs):
+        self.events.append(("end", len(documents)))
+
+    def on_retriever_error(self, error, **kwargs):
+        self.events.append(("error", type(error).__name__))
+
+
+def make_chain(store_cls=StubVectorStore, mmr=False, k=3):
+    store = store_cls(DeterministicFakeEmbedding(size=64))
+    store.add_documents([Document(page_content=f"Trecho {i} sobre IBS", metadata={"id": str(i)}) for i in range(5)])
+    return create_qa_chain(store, k=k, mmr=mmr, score_threshold=0.0, llm=StubChatModel())
+
+
+def ask(rag, **config):
+    return rag.invoke({"query": PERGUNTA, "tone": "objetivo"}, config=config)
+
+
+def test_similarity_threshold_path_stores_scores():
+    docs = ask(make_chain())["source_documents"]
+
+    assert len(docs) == 3
+    assert all(0.0 <= d.metadata["score"] <= 1.0 for d in docs)
+    assert [d.metadata["score"] for d in docs] == sorted((d.metadata["score"] for d in docs), reverse=True)
+
+
+def test_scored_mmr_path_stores_scores():
+    docs = ask(make_chain(ScoredMMRStore, mmr=True))["source_documents"]
+
+    assert [d.metadata["score"] for d in docs] == pytest.approx([0.9, 0.8, 0.7])
+
+
+def test_store_without_scored_mmr_falls_back_to_retriever():
+    rag = make_chain(mmr=True)
+    docs = ask(rag)["source_documents"]
+
+    assert [d.metadata["id"] for d in docs] == [d.metadata["id"] for d in rag.retriever.invoke(PERGUNTA)]
+    assert all("score" not in d.metadata for d in docs)
+
+
+@pytest.mark.parametrize("store_cls,mmr", [(StubVectorStore, False), (ScoredMMRStore, True)])
+def test_scored_retrieval_reports_retriever_callbacks(store_cls, mmr):
+    handler = RetrieverEvents()
+    ask(make_chain(store_cls, mmr=mmr), callbacks=[handler])
+
+    assert handler.events == [("start", PERGUNTA), ("end", 3)]
+
+
+def test_scored_retrieval_reports_retriever_error():
+    handler = RetrieverEvents()
+    with pytest.raises(ConnectionError):
+        ask(make_chain(BrokenStore), callbacks=[handler])
+
+    assert handler.events == [("start", PERGUNTA), ("error", "ConnectionError")]
+
+
+def test_traced_invoke_record_schema(monkeypatch):
+    monkeypatch.setattr(tracing, "detect_tone", lambda q: "formal e polido")
+    result, record = traced_invoke(make_chain(), PERGUNTA)
+
+    assert result["result"] == "Resposta simulada."
+    assert set(record) == {"ts", "question", "tone", "docs", "timings", "tokens"}
+    assert record["question"] == PERGUNTA
+    assert record["tone"] == "formal e polido"
+    assert [d["id"] for d in record["docs"]] == [d.metadata["id"] for d in result["source_documents"]]
+    assert all(isinstance(d["score"], float) for d in record["docs"])
+    assert set(record["timings"]) == {"tone", "retrieve", "generate", "total"}
+    assert all(v >= 0 for v in record["timings"].values())
+    assert record["timings"]["total"] >= record["timings"]["retrieve"] + record["timings"]["generate"]
+    assert record["tokens"] == {"prompt": 0, "completion": 0, "total": 0}
+    json.dumps(record)  # vai para o JSONL como está
+
+
+def test_traced_invoke_skips_detection_when_tone_is_given(monkeypatch):
+    monkeypatch.setattr(tracing, "detect_tone", lambda q: pytest.fail("não deveria detectar o tom"))
+    _, record = traced_invoke(make_chain(), PERGUNTA, tone="objetivo")
+
+    assert record["tone"] == "objetivo"
+
+
+def test_load_traces_reads_rotated_segments_in_order(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    agora = datetime(2026, 1, 1)
+    segs = [segment_path(path, agora + timedelta(minutes=m)) for m in (0, 5)]
+    segs[1].write_text('{"ts": 3}\n{"ts": 4}\n', encoding="utf-8")
+    segs[0].write_text('{"ts": 1}\n\n{"ts": 2\n', encoding="utf-8")  # linha em branco + linha truncada
+    path.write_text('{"ts": 5}\n', encoding="utf-8")
+
+    assert [t["ts"] for t in load_traces(path)] == [1, 3, 4, 5]
+
+
+def test_percentis_uses_nearest_rank():
+    s = percentis([float(v) for v in range(20, 0, -1)])
+    assert (s["n"], s["p50"], s["p90"], s["p95"], s["max"]) == (20, 10.0, 18.0, 19.0, 20.0)
+    assert s["media"] == pytest.approx(10.5)
+
+    assert percentis([float(v) for v in range(1, 201)])["p99"] == 198.0
+    assert percentis([7.0])["p50"] == 7.0
+    assert percentis([]) == {"n": 0}
@@ -0,0 +1,162 @@
+import sys
+import pathlib
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+import argparse
+import json
+import os
+import signal
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Traces e logs sintéticos vão para um diretório temporário, nunca para logs/ real.
+# Precisa vir antes de qualquer import de src (src.config lê o ambiente no import).
+_TMP_LOGS = tempfile.mkdtemp(prefix="bench_serve_")
+os.environ["LOG_DIR"] = _TMP_LOGS
+os.environ["TRACE_LOG"] = os.path.join(_TMP_LOGS, "traces.jsonl")
+os.environ["TONE_KEYWORDS_FILE"] = os.path.join(_TMP_LOGS, "tone_keywords.json")
+
+from replay_traces import construir_chain, percentis  # noqa: E402
+
+PERGUNTAS = [
+    "O que é o cashback tributário?",
+    "Qual imposto substitui PIS e Cofins?",
+    "Quando começa a transição para o novo modelo?",
+    "Quem vai gerir o IBS?",
+]
+
+
+def memoria(pid: int) -> dict:
+    """
+    Lê Rss, Pss e memória privada (USS) de um processo em /proc (só Linux).
+    Args:
+        pid (int): Processo.
+    Returns:
+        dict: Valores em MiB.
+    """
+    campos = {}
+    with open(f"/proc/{pid}/smaps_rollup", encoding="utf-8") as f:
+        for linha in f:
+            partes = linha.split()
+            if len(partes) >= 2 and partes[0].endswith(":") and partes[1].isdigit():
+                campos[partes[0][:-1]] = int(partes[1]) / 1024
+    return {
+        "rss": campos.get("Rss", 0.0),
+        "pss": campos.get("Pss", 0.0),
+        "uss": campos.get("Private_Clean", 0.0) + campos.get("Private_Dirty", 0.0),
+    }
+
+
+def filhos(pid: int) -> list:
+    with open(f"/proc/{pid}/task/{pid}/children", encoding="utf-8") as f:
+        return [int(p) for p in f.read().split()]
+
+
+def http_json(url: str, payload=None, timeout: float = 30.0):
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read())
+
+
+def subir_servidor(args, workers: int) -> int:
+    """
+    Faz fork de um processo que monta a chain e chama serve(); devolve o pid.
+    Com --real a chain usa Qdrant + OpenAI (via construir_chain) e cada worker
+    passa pelo reconnect_vectorstore de verdade; sem ele, vetor em memória + LLM falso.
+    """
+    pid = os.fork()
+    if pid == 0:
+        boot = time.monotonic()
+        from src.server import serve
+        chain_args = argparse.Namespace(
+            stub=not args.real, stub_latency=args.stub_latency, collection=args.collection, k=6, mmr=True,
+            score_threshold=0.35, chain_type="stuff", max_concurrency=4, map_token_max=3000,
+        )
+        rag = construir_chain(chain_args)
+        serve(rag, host="127.0.0.1", port=args.port, workers=workers, boot_time=boot)
+        os._exit(0)
+    return pid
+
+
+def esperar_pronto(base: str, workers: int, t0: float, timeout: float = 60.0) -> float:
+    """Consulta /ready até ver `workers` pids distintos prontos; devolve segundos desde t0."""
+    vistos = set()
+    while time.monotonic() - t0 < timeout:
+        try:
+            r = http_json(base + "/ready", timeout=2)
+            if r.get("ready"):
+                vistos.add(r["pid"])
+                if len(vistos) >= workers:
+                    return time.monotonic() - t0
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.05)
+    raise TimeoutError(f"só {len(vistos)}/{workers} workers ficaram prontos")
+
+
+def rodar(args, workers: int) -> dict:
+    base = f"http://127.0.0.1:{args.port}"
+    t0 = time.monotonic()
+    sup = subir_servidor(args, workers)
+    try:
+        pronto = esperar_pronto(base, workers, t0)
+        pids = filhos(sup) if workers > 1 else [sup]
+
+        def pedir(i: int) -> float:
+            ini = time.perf_counter()
+            http_json(base + "/ask", {"question": PERGUNTAS[i % len(PERGUNTAS)], "tone": "objetivo"})
+            return time.perf_counter() - ini
+
+        ini = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients) as pool:
+            latencias = list(pool.map(pedir, range(args.requests)))
+        duracao = time.perf_counter() - ini
+
+        mem = [memoria(p) for p in pids]
+        return {
+            "workers": workers,
+            "pronto_s": pronto,
+            "req_s": args.requests / duracao,
+            "lat": percentis(latencias),
+            "pai": memoria(sup) if workers > 1 else None,
+            "uss": sum(m["uss"] for m in mem) / len(mem),
+            "pss": sum(m["pss"] for m in mem) / len(mem),
+            "rss": sum(m["rss"] for m in mem) / len(mem),
+        }
+    finally:
+        os.kill(sup, signal.SIGTERM)
+        os.waitpid(sup, 0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark do servidor pre-fork.")
+    parser.add_argument("--workers", default="1,2,4", help="Lista de nº de workers a testar.")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--clients", type=int, default=16, help="Clientes simultâneos.")
+    parser.add_argument("--stub-latency", type=float, default=0.05, help="Latência simulada do LLM (s).")
+    parser.add_argument("--real", action="store_true",
+                        help="Qdrant + OpenAI de verdade (mede conexões por worker e ganho por núcleo).")
+    parser.add_argument("--collection", default="bench_serve", help="Coleção Qdrant usada com --real.")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    if not args.real:
+        # vetor em memória + LLM falso: a chave só satisfaz src.config
+        os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+    backend = "Qdrant + OpenAI" if args.real else f"stub (LLM {args.stub_latency * 1000:.0f} ms)"
+    print(f"CPUs: {os.cpu_count()} | {args.requests} perguntas, {args.clients} clientes, "
+          f"{backend} | logs em {_TMP_LOGS}\n")
+    print("| workers | pronto (s) | req/s | p50 (ms) | p95 (ms) | RSS/worker (MiB) | PSS/worker (MiB) | USS/worker (MiB) |")
+    print("|---|---|---|---|---|---|---|---|")
+    for n in [int(x) for x in args.workers.split(",")]:
+        r = rodar(args, n)
+        print(f"| {n} | {r['pronto_s']:.2f} | {r['req_s']:.1f} | {r['lat']['p50'] * 1000:.0f} | "
+              f"{r['lat']['p95'] * 1000:.0f} | {r['rss']:.1f} | {r['pss']:.1f} | {r['uss']:.1f} |")
+
+
+# Execução
+if __name__ == "__main__":
+    main()
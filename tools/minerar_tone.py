@@ -1,70 +1,235 @@
+import sys
+import pathlib
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
 from collections import defaultdict, Counter
+import json
+import os
 import re
+import unicodedata
+from pathlib import Path
+from src.data_loader import load_test_docs
+from src.utils.bg_writer import list_segments
 
+# Versão do formato do estado; se mudar, a mineração recomeça do zero
+VERSAO_ESTADO = 2
 
-def carregar_exemplos(caminho_log: str) -> dict:
+
+def sem_acento(txt: str) -> str:
+    """Minúsculas sem acentos (mesma forma usada por detect_tone_local nos termos minerados)."""
+    return "".join(c for c in unicodedata.normalize("NFKD", txt.lower()) if not unicodedata.combining(c))
+
+
+def termos(txt: str) -> set:
+    """Conjunto de palavras (sem acento) de um texto."""
+    return {sem_acento(w) for w in re.findall(r'\w+', txt.lower())}
+
+
+def carregar_estado(caminho_estado: Path) -> dict:
+    """
+    Lê o estado persistido da mineração (contadores por tom + posição no log).
+    Args:
+        caminho_estado (Path): Arquivo JSON de estado.
+    Returns:
+        dict: {'contadores': {tom: Counter}, 'mensagens': Counter, 'segmentos': set,
+            'ativo': {'ino', 'offset'}}. Os contadores guardam em quantas mensagens
+            de cada tom o termo apareceu.
+    """
+    estado = {
+        "contadores": defaultdict(Counter),
+        "mensagens": Counter(),
+        "segmentos": set(),
+        "ativo": {"ino": None, "offset": 0},
+    }
+    if not caminho_estado.exists():
+        return estado
+    with open(caminho_estado, encoding="utf-8") as f:
+        dados = json.load(f)
+    if dados.get("versao") != VERSAO_ESTADO:
+        return estado
+    for tom, freq in dados.get("contadores", {}).items():
+        estado["contadores"][tom] = Counter(freq)
+    estado["mensagens"] = Counter(dados.get("mensagens", {}))
+    estado["segmentos"] = set(dados.get("segmentos", []))
+    estado["ativo"] = dados.get("ativo", estado["ativo"])
+    return estado
+
+
+def salvar_json(caminho: Path, dados) -> None:
+    """
+    Grava JSON de forma atômica (arquivo temporário + os.replace).
+    Args:
+        caminho (Path): Destino.
+        dados: Conteúdo serializável.
+    """
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    tmp = caminho.with_name(caminho.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(dados, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, caminho)
+
+
+def salvar_estado(caminho_estado: Path, estado: dict) -> None:
+    """
+    Persiste o estado da mineração.
+    Args:
+        caminho_estado (Path): Arquivo JSON de estado.
+        estado (dict): Estado retornado por carregar_estado (e atualizado).
     """
-    Lê o arquivo de logs do LLM e organiza as mensagens por tom identificado.
+    salvar_json(caminho_estado, {
+        "versao": VERSAO_ESTADO,
+        "mensagens": dict(estado["mensagens"]),
+        "contadores": {tom: dict(c) for tom, c in estado["contadores"].items()},
+        "segmentos": sorted(estado["segmentos"]),
+        "ativo": estado["ativo"],
+    })
+
+
+def processar_trecho(caminho: Path, offset: int, estado: dict, stopwords_set: set) -> int:
+    """
+    Lê `caminho` a partir de `offset` e soma os termos de cada linha completa aos contadores
+    (cada termo conta uma vez por mensagem).
+    Linhas sem '\\n' final (ainda sendo gravadas) ficam para a próxima execução.
     Args:
-        caminho_log (str): Caminho para o arquivo de log gerado pelo classificador de tom LLM.
+        caminho (Path): Arquivo de log (ativo ou segmento).
+        offset (int): Posição em bytes onde parar da última vez.
+        estado (dict): Estado da mineração (contadores e mensagens atualizados in-place).
+        stopwords_set (set): Palavras a serem ignoradas.
     Returns:
-        dict: Dicionário {tom: [mensagens]}.
+        int: Novo offset (fim da última linha completa lida).
     """
-    resultados = defaultdict(list)
-    with open(caminho_log, encoding="utf-8") as f:
-        for linha in f:
-            if linha.startswith("TOM:"):
-                partes = linha.strip().split("|")
-                if len(partes) == 2:
-                    tom = partes[0].replace("TOM:", "").strip()
-                    msg = partes[1].replace("MSG:", "").strip()
-                    resultados[tom].append(msg)
-    return resultados
-
-
-def sugerir_termos_por_tom(dados_por_tom: dict, stopwords_set: set, min_freq: int = 2, max_termos: int = 30):
+    with open(caminho, "rb") as f:
+        f.seek(offset)
+        for bruta in f:
+            if not bruta.endswith(b"\n"):
+                break
+            offset += len(bruta)
+            linha = bruta.decode("utf-8", errors="replace")
+            if not linha.startswith("TOM:"):
+                continue
+            partes = linha.strip().split("|", 1)
+            if len(partes) == 2:
+                tom = partes[0].replace("TOM:", "").strip()
+                msg = partes[1].replace("MSG:", "", 1).strip()
+                estado["mensagens"][tom] += 1
+                estado["contadores"][tom].update(termos(msg) - stopwords_set)
+    return offset
+
+
+def atualizar_contadores(caminho_log: Path, estado: dict, stopwords_set: set) -> int:
     """
-    Para cada tom, imprime termos/gírias mais frequentes prontos para colar no classificador.
+    Processa só o que é novo: segmentos rotacionados ainda não vistos e o trecho
+    do arquivo ativo depois do último offset. O segmento que era o arquivo ativo
+    na execução anterior (mesmo inode) é retomado do offset salvo. Segmentos já
+    apagados pela retenção do BackgroundWriter saem do estado.
     Args:
-        dados_por_tom (dict): Dicionário {tom: [mensagens]}.
+        caminho_log (Path): Arquivo ativo do log de casos da LLM.
+        estado (dict): Estado da mineração (atualizado in-place).
         stopwords_set (set): Palavras a serem ignoradas.
-        min_freq (int): Frequência mínima para sugerir o termo.
-        max_termos (int): Número máximo de sugestões por tom.
+    Returns:
+        int: Quantidade de bytes novos processados.
+    """
+    ativo = estado["ativo"]
+    lidos = 0
+    segmentos = list_segments(caminho_log)
+    estado["segmentos"] &= {seg.name for seg in segmentos}
+    for seg in segmentos:
+        if seg.name in estado["segmentos"]:
+            continue
+        inicio = ativo["offset"] if os.stat(seg).st_ino == ativo["ino"] else 0
+        fim = processar_trecho(seg, inicio, estado, stopwords_set)
+        lidos += fim - inicio
+        estado["segmentos"].add(seg.name)
+
+    if caminho_log.exists():
+        st = os.stat(caminho_log)
+        inicio = ativo["offset"] if st.st_ino == ativo["ino"] and st.st_size >= ativo["offset"] else 0
+        fim = processar_trecho(caminho_log, inicio, estado, stopwords_set)
+        lidos += fim - inicio
+        estado["ativo"] = {"ino": st.st_ino, "offset": fim}
+    else:
+        estado["ativo"] = {"ino": None, "offset": 0}
+    return lidos
+
+
+def gerar_tabela(
+    estado: dict,
+    dominio: set,
+    min_freq: int = 2,
+    min_ratio: float = 3.0,
+    min_len: int = 3,
+    max_termos: int = 30,
+) -> dict:
+    """
+    Monta a tabela {tom: [termos]} consumida por detect_tone_local, só com termos
+    que distinguem o tom: descarta termos curtos, do vocabulário do domínio
+    (ex.: 'imposto', 'reforma') ou que aparecem em mais de um tom, e exige que a
+    taxa do termo no tom seja `min_ratio` vezes a taxa suavizada nos outros tons
+    (1 / (mensagens dos outros tons + 1), já que lá ele nunca aparece).
+    Com um único tom no log nada passa: não há contra o que comparar.
+    Args:
+        estado (dict): Estado da mineração (contadores e mensagens por tom).
+        dominio (set): Termos (sem acento) do corpus do domínio, nunca usados.
+        min_freq (int): Nº mínimo de mensagens do tom com o termo.
+        min_ratio (float): Razão mínima entre a taxa no tom e nos outros tons.
+        min_len (int): Tamanho mínimo do termo.
+        max_termos (int): Número máximo de termos por tom.
+    Returns:
+        dict: Tabela com tons em minúsculas (mesmo formato de detect_tone_local).
     """
-    for tom, frases in dados_por_tom.items():
-        palavras = []
-        for frase in frases:
-            palavras += re.findall(r'\w+', frase.lower())
-        freq = Counter(w for w in palavras if w not in stopwords_set)
-        mais_comuns = [w for w, c in freq.most_common(max_termos) if c >= min_freq]
-
-        print(f"\n# ======= {tom} ======= #")
-        if tom == "IRRITADO E CONCISO":
-            print("irritado_girias = (")
-        elif tom == "INFORMAL E DESCONTRAÍDO":
-            print("informal_girias = (")
-        elif tom == "FORMAL E POLIDO":
-            print("formal_frases = (")
-        else:
-            print("objetivo_termos = (")
-
-        for palavra in mais_comuns:
-            print(f'    "{palavra}",')
-        print(")\n")
-    print("# Copie e cole os termos acima na função detect_tone_local.")
+    contadores, mensagens = estado["contadores"], estado["mensagens"]
+    tabela = {}
+    for tom, freq in sorted(contadores.items()):
+        n_tom = mensagens[tom] or 1
+        n_outros = sum(n for t, n in mensagens.items() if t != tom)
+        candidatos = []
+        for termo, c in freq.items():
+            if c < min_freq or len(termo) < min_len or termo in dominio:
+                continue
+            if any(contadores[t][termo] for t in contadores if t != tom):
+                continue
+            ratio = (c / n_tom) * (n_outros + 1)
+            if ratio >= min_ratio:
+                candidatos.append((ratio, c, termo))
+        candidatos.sort(key=lambda x: (-x[0], -x[1], x[2]))
+        if candidatos:
+            tabela[tom.lower()] = [termo for _, _, termo in candidatos[:max_termos]]
+    return tabela
+
+
+def vocabulario_dominio() -> set:
+    """Termos do corpus indexado (src.data_loader): palavras neutras do assunto, não do tom."""
+    vocab = set()
+    for doc in load_test_docs():
+        vocab |= termos(doc["text"])
+    return vocab
 
 
 # --- Configuração ---
 
-# Caminho do log do LLM
-CAMINHO_LOG = "logs/tone_llm_cases.txt"
+LOG_DIR = Path(os.getenv("LOG_DIR", ROOT / "logs"))
+
+# Caminho do log do LLM (arquivo ativo; segmentos rotacionados ficam ao lado)
+CAMINHO_LOG = LOG_DIR / "tone_llm_cases.txt"
+
+# Estado incremental (contadores + offsets) e tabela lida por detect_tone_local
+CAMINHO_ESTADO = LOG_DIR / "tone_miner_state.json"
+CAMINHO_TABELA = Path(os.getenv("TONE_KEYWORDS_FILE", LOG_DIR / "tone_keywords.json"))
 
-# Stopwords básicas para português (pode expandir se quiser)
-STOPWORDS = set("""
+# Stopwords básicas para português (pode expandir se quiser), sem acento como os termos
+STOPWORDS = {sem_acento(w) for w in """
 de a o e que do da em um uma é para com os no na por mas se não foi vai eu você ele ela nós eles elas já tá né pra lá aqui isso aquilo então
-""".split())
+qual quais como quando quem onde porque sobre isso essa esse
+""".split()}
 
 # Execução
 if __name__ == "__main__":
-    dados_log = carregar_exemplos(CAMINHO_LOG)
-    sugerir_termos_por_tom(dados_log, STOPWORDS)
+    estado = carregar_estado(CAMINHO_ESTADO)
+    novos = atualizar_contadores(CAMINHO_LOG, estado, STOPWORDS)
+    tabela = gerar_tabela(estado, vocabulario_dominio() | STOPWORDS)
+    salvar_json(CAMINHO_TABELA, tabela)
+    salvar_estado(CAMINHO_ESTADO, estado)
+    print(f"{novos} bytes novos processados.")
+    for tom, lista in tabela.items():
+        print(f"# {tom}: {', '.join(lista)}")
+    print(f"Tabela gravada em {CAMINHO_TABELA} (detect_tone_local recarrega sozinho).")
@@ -0,0 +1,189 @@
+import sys
+import pathlib
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+import argparse
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from langchain.schema import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src.utils.stubs import StubChatModel, StubVectorStore
+
+
+def percentis(valores: List[float]) -> dict:
+    """
+    Resume uma lista de latências.
+    Args:
+        valores (List[float]): Latências em segundos.
+    Returns:
+        dict: n, média, p50, p90, p95, p99 e máximo (percentis por posto mais próximo).
+    """
+    if not valores:
+        return {"n": 0}
+    ordenados = sorted(valores)
+
+    def p(q: float) -> float:
+        return ordenados[max(0, math.ceil(q * len(ordenados)) - 1)]
+
+    return {
+        "n": len(ordenados),
+        "media": sum(ordenados) / len(ordenados),
+        "p50": p(0.50),
+        "p90": p(0.90),
+        "p95": p(0.95),
+        "p99": p(0.99),
+        "max": ordenados[-1],
+    }
+
+
+def construir_chain(args):
+    """
+    Monta a chain do replay com os mesmos parâmetros de produção (ou os da linha de comando).
+    Com --stub usa vetor em memória + LLM falso; sem --stub usa Qdrant e OpenAI reais.
+    """
+    from src.data_loader import load_test_docs
+    from src.qa_chain import create_qa_chain
+
+    docs = [Document(page_content=d["text"], metadata={"id": d["id"]}) for d in load_test_docs()]
+    llm = None
+    if args.stub:
+        store = StubVectorStore(DeterministicFakeEmbedding(size=1536))
+        store.add_documents(docs)
+        llm = StubChatModel(latency=args.stub_latency)
+    else:
+        from src.vector_store import initialize_vectorstore
+        store = initialize_vectorstore(docs, collection_name=args.collection)
+
+    return create_qa_chain(
+        store,
+        k=args.k,
+        mmr=args.mmr,
+        score_threshold=args.score_threshold,
+        chain_type=args.chain_type,
+        llm=llm,
+        max_concurrency=args.max_concurrency,
+        map_token_max=args.map_token_max,
+    )
+
+
+def replay(rag, traces: List[dict], speed: float, workers: int) -> List[dict]:
+    """
+    Reenvia as perguntas respeitando os intervalos originais de chegada (open loop).
+    Args:
+        rag: Chain criada por create_qa_chain.
+        traces (List[dict]): Registros lidos por load_traces.
+        speed (float): Fator de aceleração (1 = ritmo original, 10 = 10x mais rápido,
+            0 = tudo de uma vez).
+        workers (int): Máximo de perguntas simultâneas.
+    Returns:
+        List[dict]: Por pergunta: latência total (desde a chegada prevista), espera
+            na fila e o trace da execução.
+    """
+    from src.tracing import traced_invoke
+
+    resultados: List[dict] = []
+    lock = threading.Lock()
+    ts0 = traces[0]["ts"]
+
+    def executar(trace: dict, chegada: float) -> None:
+        inicio = time.perf_counter()
+        try:
+            _, novo = traced_invoke(rag, trace["question"], tone=trace.get("tone") or "objetivo")
+            erro = None
+        except Exception as exc:  # registra e segue: o replay mede o sistema todo
+            novo, erro = None, repr(exc)
+        fim = time.perf_counter()
+        with lock:
+            resultados.append({
+                "latencia": fim - chegada,
+                "espera": inicio - chegada,
+                "trace": novo,
+                "erro": erro,
+            })
+
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for trace in traces:
+            atraso = (trace["ts"] - ts0) / speed if speed > 0 else 0.0
+            chegada = t_start + atraso
+            espera = chegada - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+            pool.submit(executar, trace, chegada)
+    return resultados
+
+
+def imprimir_relatorio(resultados: List[dict], duracao: float) -> None:
+    """
+    Imprime distribuição de latências (total, fila e por etapa) e throughput.
+    Args:
+        resultados (List[dict]): Saída de replay.
+        duracao (float): Duração total do replay em segundos.
+    """
+    ok = [r for r in resultados if r["erro"] is None]
+    erros = len(resultados) - len(ok)
+    print(f"\n{len(resultados)} perguntas em {duracao:.1f}s "
+          f"({len(resultados) / duracao if duracao else 0:.2f} req/s) – {erros} erros")
+
+    series = {
+        "total": [r["latencia"] for r in ok],
+        "fila": [r["espera"] for r in ok],
+        "retrieve": [r["trace"]["timings"]["retrieve"] for r in ok if r["trace"]["timings"]["retrieve"] is not None],
+        "generate": [r["trace"]["timings"]["generate"] for r in ok if r["trace"]["timings"]["generate"] is not None],
+    }
+    print(f"{'etapa':<10}{'n':>6}{'média':>9}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for nome, valores in series.items():
+        s = percentis(valores)
+        if not s["n"]:
+            continue
+        print(f"{nome:<10}{s['n']:>6}" + "".join(
+            f"{s[c]:>9.3f}" for c in ("media", "p50", "p90", "p95", "p99", "max")
+        ))
+    tokens = sum(r["trace"]["tokens"]["total"] for r in ok)
+    print(f"tokens totais: {tokens}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay de traces capturados contra a chain RAG.")
+    parser.add_argument("--traces", default=None, help="Arquivo de traces (padrão: settings.trace_log).")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Aceleração do ritmo de chegada (1=original, 0=sem espera).")
+    parser.add_argument("--workers", type=int, default=8, help="Perguntas simultâneas.")
+    parser.add_argument("--limit", type=int, default=None, help="Usa só as N primeiras perguntas.")
+    parser.add_argument("--stub", action="store_true", help="Vetor em memória + LLM falso (sem Qdrant/OpenAI).")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="Latência simulada do LLM falso (s).")
+    parser.add_argument("--collection", default="reforma_tributaria")
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--mmr", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--score-threshold", type=float, default=0.35)
+    parser.add_argument("--chain-type", default="stuff", choices=("stuff", "map_reduce", "refine"))
+    parser.add_argument("--max-concurrency", type=int, default=4, help="Chamadas de map simultâneas (map_reduce).")
+    parser.add_argument("--map-token-max", type=int, default=3000, help="Tokens por pacote de trechos (map_reduce/refine).")
+    args = parser.parse_args()
+
+    if args.stub:
+        # src.config exige a chave mesmo quando nenhuma chamada à OpenAI será feita
+        os.environ.setdefault("OPENAI_API_KEY", "stub")
+    from src.config import settings
+    from src.tracing import load_traces
+
+    traces = sorted(load_traces(args.traces or settings.trace_log), key=lambda t: t["ts"])
+    if args.limit:
+        traces = traces[:args.limit]
+    if not traces:
+        print("Nenhum trace encontrado.")
+        return
+
+    rag = construir_chain(args)
+    t0 = time.perf_counter()
+    resultados = replay(rag, traces, args.speed, args.workers)
+    imprimir_relatorio(resultados, time.perf_counter() - t0)
+
+
+# Execução
+if __name__ == "__main__":
+    main()